@@ -0,0 +1,105 @@
+/*
+ * _hcsr04.c
+ * Optional C extension that times the HC-SR04 echo pulse by polling the GPIO level
+ * register through /dev/gpiomem, for Pis where the pigpio daemon isn't available.
+ * Supports the BCM2835/6/7/2711 GPIO block (Pi 1-4); other boards fall back to RPi.GPIO.
+ * Build in place with:
+ *     python setup.py build_ext --inplace
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <fcntl.h>
+#include <stdint.h>
+#include <sys/mman.h>
+#include <time.h>
+#include <unistd.h>
+
+#define GPIO_BLOCK_SIZE 4096
+/* Register offsets in 32-bit words */
+#define GPSET0 7
+#define GPCLR0 10
+#define GPLEV0 13
+
+static volatile uint32_t *gpio = NULL;
+
+static int gpio_map(void)
+{
+    if (gpio != NULL)
+        return 0;
+
+    int fd = open("/dev/gpiomem", O_RDWR | O_SYNC);
+    if (fd < 0)
+        return -1;
+    void *mem = mmap(NULL, GPIO_BLOCK_SIZE, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    close(fd);
+    if (mem == MAP_FAILED)
+        return -1;
+
+    gpio = (volatile uint32_t *)mem;
+    return 0;
+}
+
+static inline uint64_t now_ns(void)
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (uint64_t)ts.tv_sec * 1000000000ull + (uint64_t)ts.tv_nsec;
+}
+
+static PyObject *measure(PyObject *self, PyObject *args)
+{
+    int trig_pin, echo_pin;
+    double timeout_us;
+    uint64_t t, deadline, pulse_start, pulse_end;
+
+    if (!PyArg_ParseTuple(args, "iid", &trig_pin, &echo_pin, &timeout_us))
+        return NULL;
+    if (trig_pin < 0 || trig_pin > 31 || echo_pin < 0 || echo_pin > 31) {
+        PyErr_SetString(PyExc_ValueError, "GPIO pins must be in range 0-31");
+        return NULL;
+    }
+    if (gpio_map() < 0)
+        return PyErr_SetFromErrnoWithFilename(PyExc_OSError, "/dev/gpiomem");
+
+    uint32_t trig_mask = 1u << trig_pin;
+    uint32_t echo_mask = 1u << echo_pin;
+
+    Py_BEGIN_ALLOW_THREADS
+    /* 10us trigger pulse */
+    gpio[GPSET0] = trig_mask;
+    t = now_ns();
+    while (now_ns() - t < 10000)
+        ;
+    gpio[GPCLR0] = trig_mask;
+
+    deadline = now_ns() + (uint64_t)(timeout_us * 1000.0);
+
+    /* wait for echo to go high */
+    pulse_start = now_ns();
+    while ((gpio[GPLEV0] & echo_mask) == 0 && pulse_start < deadline)
+        pulse_start = now_ns();
+
+    /* wait for echo to go low */
+    pulse_end = pulse_start;
+    while ((gpio[GPLEV0] & echo_mask) != 0 && pulse_end < deadline)
+        pulse_end = now_ns();
+    Py_END_ALLOW_THREADS
+
+    return PyFloat_FromDouble((double)(pulse_end - pulse_start) / 1000.0);
+}
+
+static PyMethodDef hcsr04_methods[] = {
+    {"measure", measure, METH_VARARGS,
+     "measure(trig_pin, echo_pin, timeout_us) -> echo pulse width in microseconds"},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef hcsr04_module = {
+    PyModuleDef_HEAD_INIT, "_hcsr04", NULL, -1, hcsr04_methods
+};
+
+PyMODINIT_FUNC PyInit__hcsr04(void)
+{
+    return PyModule_Create(&hcsr04_module);
+}
@@ -1,175 +1,313 @@
 """
 app.py
-Flask backend for Smart Waste Management System.
+Quart (async Flask-compatible) backend for Smart Waste Management System.
 Endpoints:
 - GET /api/level           -> returns current level for main bin
 - GET /api/bins            -> returns list of bins and their latest levels
 - GET /stream              -> SSE stream to push updates in real-time
+
+Serve with an ASGI server, e.g.:
+    gunicorn -c gunicorn.conf.py app:app
+or
+    uvicorn app:app --workers 1 --loop uvloop
 """
 
 import time
-import json
-import threading
-from queue import Queue
-from flask import Flask, jsonify, Response, stream_with_context
-from sensor import UltrasonicSensor
+import orjson
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from quart import Quart, Response
+from sensor import UltrasonicSensor, compute_levels
 
 # Configuration
 BIN_HEIGHT_CM = 40           # physical height from sensor to bottom (adjust to your bin)
 POLL_INTERVAL = 5            # seconds between reads
 ALERT_THRESHOLD = 80.0       # percent to trigger 'full' alert
+HEARTBEAT_INTERVAL = 30      # seconds before an unchanged bin is re-published
+BINS_STREAM_CHUNK = 64       # bins per chunk when streaming /api/bins
+READ_TIMEOUT = 1.0           # seconds to wait for one (median-filtered) sensor read
+SENSOR_FAIL_THRESHOLD = 3    # consecutive failed reads before a sensor is backed off
+SENSOR_MAX_BACKOFF = 300     # seconds; cap for the exponential retry interval
 
-# If you plan multiple bins, you could create multiple UltrasonicSensor instances with different pins.
+# If you plan multiple bins, add an entry per bin with its own sensor pins.
 BINS = {
     "bin_1": {
         "name": "Main Gate Bin",
-        "sensor": UltrasonicSensor(trig_pin=23, echo_pin=24, max_distance_cm=BIN_HEIGHT_CM),
-        "height_cm": BIN_HEIGHT_CM,
-        "last_level": None,
-        "last_update": None,
-        "is_alert": False
+        "trig_pin": 23,
+        "echo_pin": 24,
+        "height_cm": BIN_HEIGHT_CM
     }
     # Add more bins here e.g. "bin_2": {...}
 }
 
-# Simple in-memory event queue used for SSE subscribers
-event_queue = Queue()
+# Live bin state kept as parallel arrays (structure-of-arrays), all indexed like bin_ids,
+# so each poll cycle converts and evaluates every bin in one vectorized step.
+bin_ids = list(BINS)
+bin_index = {bin_id: i for i, bin_id in enumerate(bin_ids)}
+bin_names = [cfg["name"] for cfg in BINS.values()]
+sensors = [
+    UltrasonicSensor(trig_pin=cfg["trig_pin"], echo_pin=cfg["echo_pin"], max_distance_cm=cfg["height_cm"])
+    for cfg in BINS.values()
+]
+heights = np.array([cfg["height_cm"] for cfg in BINS.values()], dtype=np.float64)
+distances = np.full(len(bin_ids), np.nan)
+last_levels = np.full(len(bin_ids), np.nan)    # NaN -> no reading yet / read failed
+last_updates = np.full(len(bin_ids), np.nan)   # NaN -> never updated
+is_alert = np.zeros(len(bin_ids), dtype=bool)
+# Previous cycle's values and last publish time (monotonic), used to skip unchanged updates
+prev_levels = np.full(len(bin_ids), np.nan)
+prev_alert = np.zeros(len(bin_ids), dtype=bool)
+last_published = np.full(len(bin_ids), -np.inf)
+# Per-sensor circuit breaker: consecutive failures and the monotonic time the next read is allowed
+fail_counts = np.zeros(len(bin_ids), dtype=np.int64)
+next_try = np.zeros(len(bin_ids))
+
+# Per-bin SSE update frame template with bin_id and name already baked in (escaped for %-formatting);
+# only level, is_alert and timestamp are filled per event
+_update_frame_templates = [
+    b'data: {"type":"update","data":{"bin_id":'
+    + orjson.dumps(bin_id).replace(b"%", b"%%")
+    + b',"name":'
+    + orjson.dumps(name).replace(b"%", b"%%")
+    + b',"level":%s,"is_alert":%s,"timestamp":%d}}\n\n'
+    for bin_id, name in zip(bin_ids, bin_names)
+]
+
+# Sensor reads block on GPIO echo timing, so run them side by side, one thread per sensor
+EXEC = ThreadPoolExecutor(max_workers=len(sensors), thread_name_prefix="sensor-read")
+# Each sensor's outstanding read. A read that outlives READ_TIMEOUT keeps its worker busy, so no
+# new read is submitted for that sensor until it finishes; otherwise a hung sensor would tie up
+# every worker on its lock and starve the healthy ones.
+inflight_reads = [None] * len(sensors)
+
+# Each SSE client registers its own bounded ring buffer; slow clients drop the oldest events.
+SUBSCRIBER_BUFFER = 256
+
+
+class Subscriber:
+    """One SSE client's frame buffer and wakeup event, so clients share no wait/lock state."""
+    __slots__ = ("dq", "ready")
+
+    def __init__(self):
+        self.dq = deque(maxlen=SUBSCRIBER_BUFFER)
+        self.ready = asyncio.Event()
+
+
+subscribers: set[Subscriber] = set()
+
+# Pre-encoded responses rebuilt when bin state changes: one '"bin_id":{...}' JSON member per bin
+# (streamed by /api/bins), the SSE snapshot frame sent to every new client, and the /api/level body.
+_bin_entries: list[bytes] = []
+_snapshot_bytes: bytes = b""
+_level_json_cache: bytes = b"{}"
+
+_poller_started = False
+
+app = Quart(__name__)
+
+def sse_format(data: bytes) -> bytes:
+    """Wrap encoded JSON as an SSE frame."""
+    return b"data: " + data + b"\n\n"
+
+
+def bin_state(i: int) -> dict:
+    """Return bin i's latest cached values as plain JSON-serializable types (NaN -> None)."""
+    level = last_levels[i]
+    last_update = last_updates[i]
+    return {
+        "name": bin_names[i],
+        "level": None if np.isnan(level) else float(level),
+        "is_alert": bool(is_alert[i]),
+        "last_update": None if np.isnan(last_update) else float(last_update)
+    }
+
+
+def update_frame(i: int) -> bytes:
+    """Render bin i's SSE update frame by filling the volatile fields into its pre-encoded template."""
+    level = last_levels[i]
+    return _update_frame_templates[i] % (
+        b"null" if np.isnan(level) else b"%.1f" % level,
+        b"true" if is_alert[i] else b"false",
+        int(last_updates[i])
+    )
+
+
+def refresh_caches():
+    """Rebuild the cached SSE snapshot frame and API response bodies from the current bin state."""
+    global _bin_entries, _snapshot_bytes, _level_json_cache
+    # Encode bin by bin rather than building one dict of every bin first
+    _bin_entries = [orjson.dumps(bin_id) + b":" + orjson.dumps(bin_state(i)) for i, bin_id in enumerate(bin_ids)]
+    _snapshot_bytes = sse_format(b'{"type":"snapshot","bins":{' + b",".join(_bin_entries) + b"}}")
+
+    # choose first bin by insertion order
+    _level_json_cache = orjson.dumps({"bin_id": bin_ids[0], **bin_state(0)})
+
+
+def publish(frame: bytes):
+    """Fan an encoded SSE frame out to every subscriber and wake each one."""
+    for sub in subscribers:
+        sub.dq.append(frame)
+        sub.ready.set()
 
-app = Flask(__name__)
 
-def poll_sensors():
-    """Background thread: poll sensors periodically and update in-memory store and queue events."""
+async def read_sensor(i: int) -> float:
+    """Read sensor i's filtered distance on EXEC, never stacking a read behind a still-running one."""
+    fut = inflight_reads[i]
+    if fut is not None and not fut.done():
+        raise TimeoutError("previous read still in progress")
+    fut = inflight_reads[i] = EXEC.submit(sensors[i].get_distance_cm_filtered)
+    return await asyncio.wait_for(asyncio.wrap_future(fut), READ_TIMEOUT)
+
+
+async def poll_sensors_async():
+    """Background task: poll sensors periodically and update in-memory store and queue events."""
     try:
+        # Schedule against a monotonic deadline so read latency doesn't drift the sample rate
+        next_t = time.monotonic()
         while True:
-            for bin_id, info in BINS.items():
-                try:
-                    level = info["sensor"].get_fill_level_percent(info["height_cm"])
-                except Exception as e:
-                    # If any sensor read error occurs, set None or keep previous
-                    app.logger.exception(f"Error reading sensor for {bin_id}: {e}")
-                    level = None
-
-                timestamp = time.time()
-                info["last_level"] = level
-                info["last_update"] = timestamp
-                info["is_alert"] = (level is not None and level >= ALERT_THRESHOLD)
-
-                # Push an event for listeners
-                payload = {
-                    "bin_id": bin_id,
-                    "name": info.get("name"),
-                    "level": level,
-                    "is_alert": info["is_alert"],
-                    "timestamp": int(timestamp)
-                }
-                # Put latest event in queue (non-blocking)
-                try:
-                    event_queue.put_nowait(payload)
-                except Exception:
-                    pass
-
-            time.sleep(POLL_INTERVAL)
+            # Read all sensors that aren't backed off in parallel, off the event loop
+            read_start = time.monotonic()
+            to_read = np.flatnonzero(next_try <= read_start)
+            results = await asyncio.gather(*(read_sensor(i) for i in to_read), return_exceptions=True)
+            timestamp = time.time()
+            for i, result in zip(to_read, results):
+                if isinstance(result, Exception):
+                    # Mark the level as unknown; after repeated failures, retry less and less often.
+                    # Log only on state changes, without traceback formatting.
+                    fail_counts[i] += 1
+                    if fail_counts[i] >= SENSOR_FAIL_THRESHOLD:
+                        # Python ints with a capped exponent: int64 powers overflow after ~64 failures
+                        n = int(fail_counts[i]) - SENSOR_FAIL_THRESHOLD + 1
+                        backoff = min(SENSOR_MAX_BACKOFF, POLL_INTERVAL * 2 ** min(n, 16))
+                        next_try[i] = read_start + backoff
+                    if fail_counts[i] == 1:
+                        app.logger.warning(f"Error reading sensor for {bin_ids[i]}: {result!r}")
+                    elif fail_counts[i] == SENSOR_FAIL_THRESHOLD:
+                        app.logger.warning(f"Sensor for {bin_ids[i]} failed {fail_counts[i]} times in a row; backing off")
+                    distances[i] = np.nan
+                else:
+                    if fail_counts[i]:
+                        app.logger.info(f"Sensor for {bin_ids[i]} recovered after {fail_counts[i]} failed reads")
+                        fail_counts[i] = 0
+                        next_try[i] = 0.0
+                    distances[i] = result
+                last_updates[i] = timestamp
+
+            np.copyto(prev_levels, last_levels)
+            np.copyto(prev_alert, is_alert)
+
+            # Convert every reading to % fill in one vectorized pass
+            compute_levels(distances, heights, out=last_levels)
+            np.greater_equal(last_levels, ALERT_THRESHOLD, out=is_alert)
+
+            # Push an event only for bins that changed (NaN == NaN counts as unchanged),
+            # or as a heartbeat once HEARTBEAT_INTERVAL has passed since the last one
+            now = time.monotonic()
+            unchanged = (last_levels == prev_levels) | (np.isnan(last_levels) & np.isnan(prev_levels))
+            due = ~unchanged | (is_alert != prev_alert) | (now - last_published >= HEARTBEAT_INTERVAL)
+            for i in np.flatnonzero(due):
+                last_published[i] = now
+                publish(update_frame(i))
+
+            refresh_caches()
+
+            next_t += POLL_INTERVAL
+            delay = next_t - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                # Overran the interval; re-anchor instead of bursting to catch up
+                next_t = time.monotonic()
     except Exception:
-        app.logger.exception("Sensor polling thread terminated unexpectedly.")
+        app.logger.exception("Sensor polling task terminated unexpectedly.")
+
+
+@app.before_serving
+async def _start_poller():
+    # Guard so the poller is started exactly once per process
+    global _poller_started
+    if _poller_started:
+        return
+    _poller_started = True
+    refresh_caches()
+    app.add_background_task(poll_sensors_async)
 
 
 @app.route("/api/level", methods=["GET"])
-def get_single_level():
+async def get_single_level():
     """Return the main bin's level (for single-bin simple dashboards)."""
-    # choose first bin by insertion order
-    first_key = next(iter(BINS))
-    info = BINS[first_key]
-    response = {
-        "bin_id": first_key,
-        "name": info.get("name"),
-        "level": info.get("last_level"),
-        "is_alert": info.get("is_alert"),
-        "last_update": info.get("last_update")
-    }
-    return jsonify(response)
+    return Response(_level_json_cache, mimetype="application/json")
 
 
 @app.route("/api/bins", methods=["GET"])
-def get_all_bins():
-    """Return all bins with latest cached values."""
-    result = {}
-    for bin_id, info in BINS.items():
-        result[bin_id] = {
-            "name": info.get("name"),
-            "level": info.get("last_level"),
-            "is_alert": info.get("is_alert"),
-            "last_update": info.get("last_update")
-        }
-    return jsonify(result)
+async def get_all_bins():
+    """Return all bins with latest cached values, streamed a chunk of bins at a time."""
+    # Hold on to this cycle's entries; refresh_caches swaps in a new list rather than mutating it
+    entries = _bin_entries
 
+    async def generate():
+        yield b"{"
+        for start in range(0, len(entries), BINS_STREAM_CHUNK):
+            sep = b"," if start else b""
+            yield sep + b",".join(entries[start:start + BINS_STREAM_CHUNK])
+        yield b"}"
 
-def sse_format(event: dict):
-    """Format a JSON-serializable dict as SSE data."""
-    data = json.dumps(event)
-    return f"data: {data}\n\n"
+    return Response(generate(), mimetype="application/json")
 
 
 @app.route("/stream")
-def stream():
+async def stream():
     """
     Server-Sent Events endpoint. Clients can connect and receive JSON events in real-time.
     Example JS in client:
       const es = new EventSource('/stream');
       es.onmessage = (e) => { const data = JSON.parse(e.data); ... }
     """
-    def event_stream():
-        # Send an initial snapshot of all bins
-        snapshot = {"type": "snapshot", "bins": {
-            k: {
-                "name": v["name"],
-                "level": v["last_level"],
-                "is_alert": v["is_alert"],
-                "last_update": v["last_update"]
-            } for k, v in BINS.items()
-        }}
-        yield sse_format(snapshot)
-
-        # Then stream live events from queue
-        while True:
-            try:
-                event = event_queue.get()
-                wrapped = {"type": "update", "data": event}
-                yield sse_format(wrapped)
-            except GeneratorExit:
-                break
-            except Exception:
-                continue
+    async def event_stream():
+        # Register before taking the snapshot so no update falls in between
+        sub = Subscriber()
+        subscribers.add(sub)
+
+        try:
+            # Send the cached snapshot of all bins
+            yield _snapshot_bytes
 
-    return Response(stream_with_context(event_stream()), mimetype="text/event-stream")
+            # Then stream pre-encoded live events from this client's own buffer,
+            # handing every frame that piled up to the server as one write
+            while True:
+                await sub.ready.wait()
+                sub.ready.clear()
+                frames = b"".join(sub.dq)
+                sub.dq.clear()
+                yield frames
+        finally:
+            subscribers.discard(sub)
+
+    response = Response(event_stream(), mimetype="text/event-stream")
+    # SSE connections are long-lived; don't let Quart's response timeout cut them off
+    response.timeout = None
+    return response
 
 
 # Optional: endpoint to manually trigger test alerts / simulate levels
 @app.route("/api/simulate/<bin_id>/<float:level>", methods=["POST"])
-def simulate_level(bin_id, level):
-    if bin_id not in BINS:
-        return jsonify({"error": "unknown bin id"}), 404
-    info = BINS[bin_id]
-    info["last_level"] = float(level)
-    info["last_update"] = time.time()
-    info["is_alert"] = level >= ALERT_THRESHOLD
-    payload = {
-        "bin_id": bin_id,
-        "name": info.get("name"),
-        "level": info.get("last_level"),
-        "is_alert": info["is_alert"],
-        "timestamp": int(info["last_update"])
-    }
-    try:
-        event_queue.put_nowait(payload)
-    except Exception:
-        pass
-    return jsonify({"ok": True, "bin": bin_id, "level": level})
+async def simulate_level(bin_id, level):
+    i = bin_index.get(bin_id)
+    if i is None:
+        return Response(orjson.dumps({"error": "unknown bin id"}), status=404, mimetype="application/json")
+    last_levels[i] = round(level, 1)  # same 0.1% resolution as sensor readings
+    last_updates[i] = time.time()
+    is_alert[i] = last_levels[i] >= ALERT_THRESHOLD
+    refresh_caches()
+    last_published[i] = time.monotonic()
+    publish(update_frame(i))
+    return Response(orjson.dumps({"ok": True, "bin": bin_id, "level": level}), mimetype="application/json")
 
 
 if __name__ == "__main__":
-    # Start background polling thread
-    poller = threading.Thread(target=poll_sensors, daemon=True)
-    poller.start()
-
-    # For production, use gunicorn/uvicorn or a WSGI server. Flask dev server is okay for testing.
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # The sensor poller is started by the before_serving hook.
+    # For production, use gunicorn/uvicorn (see module docstring). Quart dev server is okay for testing.
+    # The reloader would spawn a second process (and poller), so keep it off.
+    app.run(host="0.0.0.0", port=5000, use_reloader=False)
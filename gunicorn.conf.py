@@ -0,0 +1,14 @@
+"""
+gunicorn.conf.py
+Production server settings. Run with:
+    gunicorn -c gunicorn.conf.py app:app
+"""
+
+# A single worker keeps one sensor poller and one copy of the in-memory bin state;
+# the ASGI event loop inside it serves all concurrent SSE clients.
+workers = 1
+worker_class = "uvicorn_worker.UvicornWorker"
+bind = "0.0.0.0:5000"
+# Worker heartbeat: the arbiter restarts a worker (and with it the poller) that hangs this long
+timeout = 30
+keepalive = 75
@@ -1,31 +1,69 @@
 """
 mqtt_client.py
 Simple MQTT publisher that can be used to push sensor readings to a broker.
+Readings are queued in a bounded ring buffer and published by a background drainer thread,
+so callers never wait on the network.
 """
 
-import json
 import time
+import threading
+from collections import deque
+import orjson
 from paho.mqtt import client as mqtt_client
 
 BROKER = "your.mqtt.broker"
 PORT = 1883
 TOPIC_BASE = "smartwaste"
 CLIENT_ID = "smartwaste-pi-1"
+OUTQ_MAXLEN = 1024           # oldest pending publishes are dropped beyond this
+
+# Pending (topic, payload bytes) publishes, drained by the thread started in run_publisher()
+_outq = deque(maxlen=OUTQ_MAXLEN)
+_outq_ready = threading.Event()
+# Set while connected to the broker; readings wait in _outq (not in paho's queue) during outages
+_connected = threading.Event()
+# Last reading queued per topic (ignoring its timestamp), used to coalesce identical consecutive readings
+_last_reading = {}
 
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
         print("Connected to MQTT Broker!")
+        _connected.set()
+        _outq_ready.set()  # flush anything queued while disconnected
     else:
         print("Failed to connect, return code %d\n", rc)
 
+def on_disconnect(client, userdata, rc):
+    _connected.clear()
+
 def publish_level(client, bin_id, payload):
+    """Queue a level reading for the drainer thread started by run_publisher(); never blocks on the network."""
     topic = f"{TOPIC_BASE}/{bin_id}/level"
-    client.publish(topic, json.dumps(payload), qos=1)
+    reading = {k: v for k, v in payload.items() if k != "timestamp"}
+    if _last_reading.get(topic) == reading:
+        return
+    _last_reading[topic] = reading
+    _outq.append((topic, orjson.dumps(payload)))
+    _outq_ready.set()
+
+def _drain(client):
+    """Background thread: hand queued payloads to paho, whose network loop does the sending."""
+    while True:
+        _outq_ready.wait()
+        _outq_ready.clear()
+        _connected.wait()
+        while _outq and _connected.is_set():
+            topic, data = _outq.popleft()
+            client.publish(topic, data, qos=1)
 
 def run_publisher():
     client = mqtt_client.Client(CLIENT_ID)
     client.on_connect = on_connect
+    client.on_disconnect = on_disconnect
+    # Bound paho's own QoS 1 queue too, so nothing grows without limit behind the ring buffer
+    client.max_queued_messages_set(OUTQ_MAXLEN)
     client.connect(BROKER, PORT)
     client.loop_start()
+    threading.Thread(target=_drain, args=(client,), daemon=True).start()
     # usage: publish_level(client, "bin_1", {"level": 63.5, "timestamp": int(time.time())})
     return client
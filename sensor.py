@@ -1,11 +1,29 @@
 """
 sensor.py
-Sensor reading abstraction for HC-SR04 (ultrasonic) with RPi.GPIO support.
-If RPi.GPIO isn't available (e.g., developing on your PC), it falls back to a simulator.
+Sensor reading abstraction for HC-SR04 (ultrasonic) with pigpio / RPi.GPIO support.
+If the pigpio daemon is reachable, echo edges are timestamped by pigpio instead of a Python polling loop;
+otherwise the optional _hcsr04 C extension (see setup.py) times the echo in a native loop.
+If neither pigpio nor RPi.GPIO is available (e.g., developing on your PC), it falls back to a simulator.
 """
 
 import time
 import random
+import threading
+import numpy as np
+
+try:
+    import pigpio
+    HAS_PIGPIO = True
+except Exception:
+    # pigpio not installed; fall back to RPi.GPIO polling
+    HAS_PIGPIO = False
+
+try:
+    import _hcsr04
+    HAS_HCSR04_EXT = True
+except Exception:
+    # C extension not built; fall back to the Python polling loop
+    HAS_HCSR04_EXT = False
 
 try:
     import RPi.GPIO as GPIO
@@ -14,6 +32,9 @@ except Exception:
     # Not running on Raspberry Pi or RPi.GPIO not installed
     IS_RPI = False
 
+MEDIAN_SAMPLES = 5       # readings per filtered measurement (odd, so there is a middle value)
+PING_INTERVAL = 0.06     # HC-SR04 needs ~60ms between pings so stray echoes don't bleed into the next read
+
 class UltrasonicSensor:
     """
     Simple HC-SR04 reader.
@@ -25,60 +46,141 @@ class UltrasonicSensor:
         self.trig = trig_pin
         self.echo = echo_pin
         self.max_distance = max_distance_cm
+        self.pi = None
+        # Serializes reads so a slow/timed-out read never overlaps the next one on the same pins
+        self._lock = threading.Lock()
+        # Reused sample buffer for median filtering, so filtered reads don't allocate
+        self._buf = np.empty(MEDIAN_SAMPLES, dtype=np.float64)
 
-        if IS_RPI:
+        if HAS_PIGPIO:
+            pi = pigpio.pi()
+            if pi.connected:
+                self.pi = pi
+
+        if self.pi is not None:
+            self.pi.set_mode(self.trig, pigpio.OUTPUT)
+            self.pi.set_mode(self.echo, pigpio.INPUT)
+            self.pi.write(self.trig, 0)
+            self._t_rise = None
+            self._t_fall = None
+            self._echo_done = threading.Event()
+            # pigpio timestamps each edge (in microseconds) as it happens
+            self._cb = self.pi.callback(self.echo, pigpio.EITHER_EDGE, self._on_edge)
+            time.sleep(0.5)
+        elif IS_RPI:
             GPIO.setmode(GPIO.BCM)
             GPIO.setup(self.trig, GPIO.OUT)
             GPIO.setup(self.echo, GPIO.IN)
             GPIO.output(self.trig, False)
             time.sleep(0.5)
 
+        # Without pigpio, prefer the native echo-timing loop when it has been built
+        self._use_ext = self.pi is None and IS_RPI and HAS_HCSR04_EXT
+
+    def _on_edge(self, gpio, level, tick):
+        """pigpio callback: record echo rise/fall ticks and signal when the pulse is complete."""
+        if level == 1:
+            self._t_rise = tick
+        elif level == 0 and self._t_rise is not None:
+            self._t_fall = tick
+            self._echo_done.set()
+
+    def _clamp_distance(self, distance_cm):
+        # If measurement fails or is greater than max_distance, clamp
+        if distance_cm <= 0 or distance_cm > 400:
+            return float(self.max_distance)
+        return min(distance_cm, float(self.max_distance))
+
+    def _get_distance_cm_pigpio(self):
+        self._t_rise = None
+        self._t_fall = None
+        self._echo_done.clear()
+
+        # 10us trigger pulse generated by the pigpio daemon
+        self.pi.gpio_trigger(self.trig, 10, 1)
+        if not self._echo_done.wait(0.04):  # 40ms timeout
+            return float(self.max_distance)
+
+        pulse_us = pigpio.tickDiff(self._t_rise, self._t_fall)
+        # speed of sound ~34300 cm/s => distance = (pulse_duration * 34300)/2
+        distance_cm = (pulse_us * 34300.0) / 2.0 / 1e6
+        return self._clamp_distance(distance_cm)
+
     def get_distance_cm(self):
         """Return measured distance in cm. If not on RPi, return simulated value."""
+        with self._lock:
+            return self._read_distance_cm()
+
+    def get_distance_cm_filtered(self):
+        """Return the median of MEDIAN_SAMPLES distance readings in cm, rejecting one-off spikes."""
+        buf = self._buf
+        mid = len(buf) // 2
+        with self._lock:
+            for k in range(len(buf)):
+                if k and (self.pi is not None or IS_RPI):
+                    time.sleep(PING_INTERVAL)
+                buf[k] = self._read_distance_cm()
+            # In-place partial sort: buf[mid] ends up as the median
+            buf.partition(mid)
+            return float(buf[mid])
+
+    def _read_distance_cm(self):
+        if self.pi is not None:
+            return self._get_distance_cm_pigpio()
+
         if not IS_RPI:
             # Simulated random distance between 2cm and max_distance
             return random.uniform(2.0, float(self.max_distance))
 
+        if self._use_ext:
+            try:
+                pulse_us = _hcsr04.measure(self.trig, self.echo, 40000.0)  # 40ms timeout
+            except OSError:
+                # /dev/gpiomem unavailable; use the Python loop from now on
+                self._use_ext = False
+            else:
+                distance_cm = (pulse_us * 34300.0) / 2.0 / 1e6
+                return self._clamp_distance(distance_cm)
+
         # Trigger pulse
         GPIO.output(self.trig, True)
         time.sleep(0.00001)  # 10us
         GPIO.output(self.trig, False)
 
-        pulse_start = time.time()
-        timeout = pulse_start + 0.04  # 40ms timeout
+        # Integer monotonic nanoseconds: immune to wall-clock jumps and cheaper than float time.time()
+        pulse_start = time.monotonic_ns()
+        timeout = pulse_start + 40_000_000  # 40ms timeout
 
         # wait for echo to go high
-        while GPIO.input(self.echo) == 0 and time.time() < timeout:
-            pulse_start = time.time()
+        while GPIO.input(self.echo) == 0 and time.monotonic_ns() < timeout:
+            pulse_start = time.monotonic_ns()
 
-        pulse_end = time.time()
+        pulse_end = time.monotonic_ns()
         # wait for echo to go low
-        while GPIO.input(self.echo) == 1 and time.time() < timeout:
-            pulse_end = time.time()
+        while GPIO.input(self.echo) == 1 and time.monotonic_ns() < timeout:
+            pulse_end = time.monotonic_ns()
 
-        pulse_duration = pulse_end - pulse_start
+        pulse_duration_ns = pulse_end - pulse_start
         # speed of sound ~34300 cm/s => distance = (pulse_duration * 34300)/2
-        distance_cm = (pulse_duration * 34300.0) / 2.0
-        # If measurement fails or is greater than max_distance, clamp
-        if distance_cm <= 0 or distance_cm > 400:
-            return float(self.max_distance)
-        return min(distance_cm, float(self.max_distance))
-
-    def get_fill_level_percent(self, bin_height_cm):
-        """
-        Convert distance reading to % fill.
-        bin_height_cm: physical height from sensor to bottom (or maximum measurable distance)
-        0% -> empty (distance == bin_height), 100% -> full (distance == near 0)
-        """
-        dist = self.get_distance_cm()
-        # Cap to bin height
-        effective_dist = min(dist, bin_height_cm)
-        # fill = (1 - distance/height) * 100
-        fill = (1.0 - (effective_dist / float(bin_height_cm))) * 100.0
-        # clamp
-        fill = max(0.0, min(100.0, fill))
-        return round(fill, 1)
+        distance_cm = (pulse_duration_ns * 34300.0) / 2.0 / 1e9
+        return self._clamp_distance(distance_cm)
 
     def cleanup(self):
-        if IS_RPI:
+        if self.pi is not None:
+            self._cb.cancel()
+            self.pi.stop()
+        elif IS_RPI:
             GPIO.cleanup()
+
+
+def compute_levels(distances_arr, heights_arr, out):
+    """
+    Convert distance readings to % fill for all bins at once, writing into `out`.
+    heights_arr: physical height from sensor to bottom (or maximum measurable distance) per bin
+    0% -> empty (distance == bin_height), 100% -> full (distance == near 0)
+    NaN distances (failed reads) stay NaN.
+    """
+    # fill = (1 - distance/height) * 100, clamped to [0, 100]
+    np.clip((1.0 - distances_arr / heights_arr) * 100.0, 0.0, 100.0, out=out)
+    np.round(out, 1, out=out)
+    return out
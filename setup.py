@@ -0,0 +1,14 @@
+"""
+setup.py
+Builds the optional _hcsr04 C extension used for HC-SR04 echo timing on Raspberry Pi.
+Usage (on the Pi):
+    python setup.py build_ext --inplace
+"""
+
+from setuptools import setup, Extension
+
+setup(
+    name="smartwaste-hcsr04",
+    py_modules=[],
+    ext_modules=[Extension("_hcsr04", sources=["_hcsr04.c"])],
+)